@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+import argparse, html, http.client, http.server, json, os, platform, re, shlex, signal, socket, subprocess, sys, threading, time, timeit, urllib.parse  # Python 3 required
+
+import dsvw
+
+QUERIES = {"short": "id=2", "long": "&".join("p%d=%s" % (_, "x" * 32) for _ in range(200)), "polluted": "username=admin&%s" % "&".join("password=%%27%%2F*%d*%%2FOR%%2F*" % _ for _ in range(500)), "mixed": "&".join("a%d=%d?b%d=%d&a%d=%d" % ((_,) * 6) for _ in range(100))}
+SKIP_REGEX, STANDIN_BODY = r"\(memory\) \[exploit\]|\(time\) \[exploit\]|\(pickle\) \[exploit\]", b"print('DSVW stand-in')\n"
+
+def legacy(query):
+    return dict((match.group("parameter"), urllib.parse.unquote(','.join(re.findall(r"(?:\A|[?&])%s=([^&]+)" % match.group("parameter"), query)))) for match in re.finditer(r"((\A|[?&])(?P<parameter>[\w\[\]]+)=)([^&]+)", query))
+
+def params(args):
+    for name, query in QUERIES.items():
+        if legacy(query) != dsvw.parse("/?%s" % query)[2]:
+            sys.exit("[x] results differ for '%s' query" % name)
+        old, new = (min(timeit.repeat(_, number=args.number, repeat=args.repeat)) / args.number for _ in (lambda: legacy(query), lambda: dsvw.parse("/?%s" % query)))
+        print("%-10s (%6d chars)  legacy: %10.1f us  single-pass: %8.1f us  (x%.1f)" % (name, len(query), old * 1e6, new * 1e6, old / new))
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def targets(standin_port):  # (label, URL) pairs taken from CASES, with every remote resource pointed at the local stand-in server
+    for case in dsvw.CASES:
+        for kind, url in (("vulnerable", case[1]), ("exploit", case[2])):
+            if url:
+                url = html.unescape(url.split('"', 1)[0].split('#', 1)[0]).replace(" ", "%20")
+                url = re.sub(r"(?i)https?%3A%2F%2F[^%&]+(%3A\d+)?", "http%%3A%%2F%%2F127.0.0.1%%3A%d" % standin_port, re.sub(r"domain=[^&%]+", "domain=localhost", url))
+                yield "%s [%s]" % (re.sub(r"<[^>]+>", "", case[0]), kind), url if url.startswith('/') else "/%s" % url
+
+def percentile(values, fraction):
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))] if values else None
+
+def run(port, url, requests, concurrency, timeout):
+    latencies, statuses, errors, lock, counter = [], {}, [0], threading.Lock(), iter(range(requests))
+
+    def worker():
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+        while next(counter, None) is not None:
+            start = time.perf_counter()
+            try:
+                connection.request("GET", url)
+                response = connection.getresponse()
+                response.read()
+            except Exception:
+                connection.close()
+                with lock:
+                    errors[0] += 1
+            else:
+                with lock:
+                    latencies.append(time.perf_counter() - start)
+                    statuses[response.status] = statuses.get(response.status, 0) + 1
+        connection.close()
+
+    start, threads = time.perf_counter(), [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed, latencies = time.perf_counter() - start, sorted(latencies)
+    return {"url": url, "requests": requests, "errors": errors[0], "statuses": dict((str(_), statuses[_]) for _ in sorted(statuses)), "seconds": round(elapsed, 6), "rps": round(len(latencies) / elapsed, 2), "p50": percentile(latencies, 0.50), "p95": percentile(latencies, 0.95), "p99": percentile(latencies, 0.99)}
+
+def load(args):
+    class StandinHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain")
+            self.send_header("Content-Length", str(len(STANDIN_BODY)))
+            self.end_headers()
+            self.wfile.write(STANDIN_BODY)
+
+        def log_message(self, format, *args):
+            pass
+
+    standin, port = http.server.ThreadingHTTPServer(("127.0.0.1", 0), StandinHandler), free_port()
+    threading.Thread(target=standin.serve_forever, daemon=True).start()
+    server = subprocess.Popen([sys.executable, os.path.abspath(dsvw.__file__), "--port", str(port)] + shlex.split(args.server_args), cwd=os.path.dirname(os.path.abspath(dsvw.__file__)), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        for _ in range(100):
+            try:
+                socket.create_connection(("127.0.0.1", port), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            sys.exit("[x] server did not start on port %d" % port)
+        baseline = json.load(open(args.compare))["cases"] if args.compare else {}
+        results = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(), "server_args": args.server_args, "requests": args.requests, "concurrency": args.concurrency, "cases": {}}
+        print("%-58s %9s %9s %9s %9s %7s" % ("case", "rps", "p50 ms", "p95 ms", "p99 ms", "errors"))
+        for label, url in targets(standin.server_address[1]):
+            if args.skip and re.search(args.skip, label):
+                print("%-58s skipped" % label)
+                continue
+            result = results["cases"][label] = run(port, url, args.requests, args.concurrency, args.timeout)
+            print("%-58s %9.1f %9s %9s %9s %7d%s" % (label[:58], result["rps"], *("%.2f" % (result[_] * 1000) if result[_] is not None else "-" for _ in ("p50", "p95", "p99")), result["errors"], "   (rps x%.2f vs baseline)" % (result["rps"] / baseline[label]["rps"]) if baseline.get(label, {}).get("rps") else ""))
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.wait()
+        standin.shutdown()
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("\n[i] results saved to '%s'" % args.output)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="%s benchmarks" % dsvw.NAME)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparser = subparsers.add_parser("params", help="micro-benchmark of the query-string parser against the original regex-based one")
+    subparser.add_argument("--number", type=int, default=20, help="calls per timing run (default: %(default)s)")
+    subparser.add_argument("--repeat", type=int, default=5, help="timing runs (default: %(default)s)")
+    subparser = subparsers.add_parser("load", help="replay the 'vulnerable' and 'exploit' URLs of all CASES against a local server instance")
+    subparser.add_argument("--requests", type=int, default=200, help="requests per case (default: %(default)s)")
+    subparser.add_argument("--concurrency", type=int, default=8, help="concurrent client connections (default: %(default)s)")
+    subparser.add_argument("--timeout", type=float, default=30, help="per-request timeout in seconds (default: %(default)s)")
+    subparser.add_argument("--server-args", default="", help="extra arguments for dsvw.py (e.g. \"--engine asyncio --keep-alive\")")
+    subparser.add_argument("--skip", default=SKIP_REGEX, help="regex of case labels to skip (default: '%(default)s')")
+    subparser.add_argument("--output", default="bench-%s.json" % time.strftime("%Y%m%d-%H%M%S"), help="JSON results file (default: bench-<timestamp>.json)")
+    subparser.add_argument("--compare", help="previous JSON results file to compare RPS against")
+    args = parser.parse_args()
+    globals()[args.command](args)
